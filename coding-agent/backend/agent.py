@@ -1,5 +1,6 @@
 import os
 import asyncio
+import functools
 from typing import List, Tuple, Dict, Any
 from langchain_community.llms import Ollama
 from langchain.agents import initialize_agent, AgentType
@@ -91,14 +92,18 @@ class CodingAgent:
             logs.append(f"Warning: Could not change to workspace {workspace_path}: {e}")
         
         try:
-            # Add task to memory
-            self.memory.add_memory(
-                content=f"Task: {task}",
-                metadata={
-                    "type": "task",
-                    "timestamp": time.time(),
-                    "workspace": workspace_path
-                }
+            # Add task to memory (off the event loop, it may wait on compaction)
+            await asyncio.get_event_loop().run_in_executor(
+                None,
+                functools.partial(
+                    self.memory.add_memory,
+                    content=f"Task: {task}",
+                    metadata={
+                        "type": "task",
+                        "timestamp": time.time(),
+                        "workspace": workspace_path
+                    }
+                )
             )
             
             # Create the full prompt
@@ -115,13 +120,17 @@ class CodingAgent:
             logs.append("Agent execution completed")
             
             # Store result in memory
-            self.memory.add_memory(
-                content=f"Result: {result}",
-                metadata={
-                    "type": "result",
-                    "timestamp": time.time(),
-                    "task": task
-                }
+            await asyncio.get_event_loop().run_in_executor(
+                None,
+                functools.partial(
+                    self.memory.add_memory,
+                    content=f"Result: {result}",
+                    metadata={
+                        "type": "result",
+                        "timestamp": time.time(),
+                        "task": task
+                    }
+                )
             )
             
             return result, logs
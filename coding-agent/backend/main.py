@@ -15,6 +15,14 @@ class TaskResponse(BaseModel):
 
 agent = CodingAgent()
 
+@app.on_event("startup")
+async def start_memory_compaction():
+    agent.memory.start_compaction()
+
+@app.on_event("shutdown")
+async def stop_memory_compaction():
+    agent.memory.stop_compaction()
+
 @app.post("/execute-task", response_model=TaskResponse)
 async def execute_task(request: TaskRequest):
     try:
@@ -1,39 +1,116 @@
 import os
+import shutil
 import chromadb
 from chromadb.config import Settings
-from typing import List, Dict, Any
+from chromadb.segment.impl.vector.local_persistent_hnsw import PersistentData
+from typing import List, Dict, Any, Optional
 import json
+import hashlib
+import sqlite3
+import threading
+import time
 from datetime import datetime
 
+COLLECTION_NAME = "coding_agent_memory"
+# Left behind by compaction runs of earlier versions that rebuilt the collection
+REBUILD_COLLECTION_NAME = "coding_agent_memory_rebuild"
+
+# Default time-to-live per memory type, in seconds
+DEFAULT_TTLS = {
+    "task": 30 * 24 * 3600,
+    "result": 90 * 24 * 3600,
+}
+
+# Once max_entries is exceeded, evict down to this fraction of it
+EVICTION_WATERMARK = 0.9
+
+# Number of nearest neighbours checked when merging duplicate results
+DUPLICATE_NEIGHBOURS = 10
+
+# Batch size used when writing out access times
+UPDATE_BATCH_SIZE = 1000
+
+# Fraction of free pages above which the SQLite store is vacuumed
+VACUUM_FREE_FRACTION = 0.25
+
 class LocalMemory:
-    def __init__(self, persist_directory: str = "./chroma_db"):
+    def __init__(
+        self,
+        persist_directory: str = "./chroma_db",
+        ttls: Optional[Dict[str, float]] = None,
+        max_entries: int = 10000,
+        duplicate_distance: float = 0.05,
+        embedding_function: Any = None,
+    ):
         """
         Initialize local memory using ChromaDB
 
         Args:
             persist_directory: Directory to persist the database
+            ttls: Time-to-live in seconds per memory type (e.g. "task", "result")
+            max_entries: Maximum number of entries kept before LRU eviction
+            duplicate_distance: Embedding distance below which results are merged
+            embedding_function: ChromaDB embedding function, defaults to Chroma's own
         """
-        self.persist_directory = persist_directory
+        # Resolve once so a later os.chdir (see CodingAgent.run_task) can't move the store
+        self.persist_directory = os.path.abspath(persist_directory)
+        self.ttls = dict(DEFAULT_TTLS if ttls is None else ttls)
+        self.max_entries = max_entries
+        self.duplicate_distance = duplicate_distance
+        self.embedding_function = embedding_function
+
+        # Guards the collection, pending access times and retention metrics,
+        # which are shared between request handlers and the compaction thread
+        self._lock = threading.RLock()
+        self._pending_access: Dict[str, float] = {}
+        self._compaction_thread = None
+        self._stop_compaction = threading.Event()
+        self.retention_stats = {
+            "duplicates_skipped": 0,
+            "expired_deleted": 0,
+            "evicted": 0,
+            "merged": 0,
+            "rows_pruned": 0,
+            "compactions": 0,
+            "bytes_reclaimed": 0,
+            "last_compaction": None,
+        }
 
         # Ensure directory exists
-        os.makedirs(persist_directory, exist_ok=True)
+        os.makedirs(self.persist_directory, exist_ok=True)
 
         # Initialize ChromaDB client
         self.client = chromadb.PersistentClient(
-            path=persist_directory,
+            path=self.persist_directory,
             settings=Settings(anonymized_telemetry=False)
         )
 
-        # Get or create collection
-        try:
-            self.collection = self.client.get_collection("coding_agent_memory")
-        except:
-            self.collection = self.client.create_collection("coding_agent_memory")
+        # Recover from a compaction that was interrupted mid-rebuild
+        names = [c.name for c in self.client.list_collections()]
+        if REBUILD_COLLECTION_NAME in names:
+            if COLLECTION_NAME in names:
+                self.client.delete_collection(REBUILD_COLLECTION_NAME)
+            else:
+                self._open_collection(REBUILD_COLLECTION_NAME).modify(name=COLLECTION_NAME)
+
+        self.collection = self._open_collection(COLLECTION_NAME)
+
+    def _open_collection(self, name: str):
+        """Get or create a collection using the configured embedding function"""
+        kwargs = {}
+        if self.embedding_function is not None:
+            kwargs["embedding_function"] = self.embedding_function
+        return self.client.get_or_create_collection(name, **kwargs)
 
     def add_memory(self, content: str, metadata: Dict[str, Any] = None) -> str:
         """
         Add a memory entry
 
+        Identical content of the same type is stored once: a repeated write
+        updates the existing entry with the new metadata and counts as a fresh
+        write, so its timestamp, created_at and last access are reset and its
+        TTL runs from the latest write.
+
         Args:
             content: The memory content
             metadata: Additional metadata
@@ -41,21 +118,43 @@ class LocalMemory:
         Returns:
             Memory ID
         """
-        memory_id = f"memory_{datetime.now().timestamp()}_{hash(content)}"
-
         # Prepare metadata
         if metadata is None:
             metadata = {}
 
-        metadata["timestamp"] = datetime.now().isoformat()
-        metadata["content_length"] = len(content)
+        content_hash = hashlib.sha256(content.encode("utf-8")).hexdigest()
+        key = f"{metadata.get('type', '')}\0{content}"
+        memory_id = f"memory_{hashlib.sha256(key.encode('utf-8')).hexdigest()}"
+        now = time.time()
+
+        with self._lock:
+            existing = self.collection.get(ids=[memory_id], include=["metadatas"])
+            if existing["ids"]:
+                merged = dict(existing["metadatas"][0] or {})
+                merged.update(metadata)
+                merged["timestamp"] = datetime.now().isoformat()
+                merged["created_at"] = now
+                merged["last_accessed"] = now
+                self.collection.update(ids=[memory_id], metadatas=[merged])
+                self._pending_access.pop(memory_id, None)
+                self.retention_stats["duplicates_skipped"] += 1
+                return memory_id
+
+            metadata["timestamp"] = datetime.now().isoformat()
+            metadata["content_length"] = len(content)
+            metadata["content_hash"] = content_hash
+            metadata["created_at"] = now
+            metadata["last_accessed"] = now
+
+            # Add to collection
+            self.collection.add(
+                documents=[content],
+                metadatas=[metadata],
+                ids=[memory_id]
+            )
 
-        # Add to collection
-        self.collection.add(
-            documents=[content],
-            metadatas=[metadata],
-            ids=[memory_id]
-        )
+            if self.max_entries and self.collection.count() > self.max_entries:
+                self.evict_lru()
 
         return memory_id
 
@@ -71,11 +170,17 @@ class LocalMemory:
             List of memory entries with scores
         """
         try:
-            results = self.collection.query(
-                query_texts=[query],
-                n_results=n_results,
-                include=["documents", "metadatas", "distances"]
-            )
+            with self._lock:
+                results = self.collection.query(
+                    query_texts=[query],
+                    n_results=n_results,
+                    include=["documents", "metadatas", "distances"]
+                )
+
+                # Access times are kept in memory and written out on compaction
+                now = time.time()
+                for memory_id in results["ids"][0] if results["ids"] else []:
+                    self._pending_access[memory_id] = now
 
             memories = []
             if results["documents"]:
@@ -105,7 +210,8 @@ class LocalMemory:
         """
         try:
             # Get all memories and sort by timestamp
-            all_results = self.collection.get(include=["documents", "metadatas"])
+            with self._lock:
+                all_results = self.collection.get(include=["documents", "metadatas"])
 
             if not all_results["documents"]:
                 return []
@@ -140,8 +246,10 @@ class LocalMemory:
             Success status
         """
         try:
-            self.client.delete_collection("coding_agent_memory")
-            self.collection = self.client.create_collection("coding_agent_memory")
+            with self._lock:
+                self.client.delete_collection(COLLECTION_NAME)
+                self.collection = self._open_collection(COLLECTION_NAME)
+                self._pending_access.clear()
             return True
         except Exception as e:
             print(f"Error clearing memory: {e}")
@@ -155,12 +263,16 @@ class LocalMemory:
             Dictionary with memory stats
         """
         try:
-            count = self.collection.count()
+            with self._lock:
+                count = self.collection.count()
+                retention = dict(self.retention_stats)
             recent = self.get_recent_memories(1)
 
             stats = {
                 "total_memories": count,
-                "last_updated": recent[0]["timestamp"] if recent else None
+                "last_updated": recent[0]["timestamp"] if recent else None,
+                "store_bytes": self._store_size(),
+                "retention": retention
             }
 
             return stats
@@ -168,3 +280,390 @@ class LocalMemory:
         except Exception as e:
             print(f"Error getting memory stats: {e}")
             return {"error": str(e)}
+
+    @staticmethod
+    def _created_at(metadata: Dict[str, Any]) -> float:
+        """Creation time of a memory, falling back to the ISO timestamp for older entries"""
+        created_at = metadata.get("created_at")
+        if isinstance(created_at, (int, float)):
+            return float(created_at)
+        try:
+            return datetime.fromisoformat(metadata.get("timestamp", "")).timestamp()
+        except (TypeError, ValueError):
+            return 0.0
+
+    def _last_accessed(self, memory_id: str, metadata: Dict[str, Any]) -> float:
+        """Last access time of a memory, including accesses not yet written out"""
+        last_accessed = metadata.get("last_accessed")
+        if not isinstance(last_accessed, (int, float)):
+            last_accessed = self._created_at(metadata)
+        return max(float(last_accessed), self._pending_access.get(memory_id, 0.0))
+
+    def _store_size(self) -> int:
+        """Total size in bytes of the persisted store"""
+        total = 0
+        for root, _, files in os.walk(self.persist_directory):
+            for name in files:
+                try:
+                    total += os.path.getsize(os.path.join(root, name))
+                except OSError:
+                    continue
+        return total
+
+    def _eviction_count(self, count: int) -> int:
+        """Number of entries to evict so a store of `count` entries is back under the cap"""
+        if not self.max_entries or count <= self.max_entries:
+            return 0
+        return count - int(self.max_entries * EVICTION_WATERMARK)
+
+    def _least_recently_used(self, ids: List[str], metadatas: List[Dict[str, Any]], count: int) -> List[str]:
+        """The `count` least recently accessed ids"""
+        entries = sorted(
+            zip(ids, metadatas),
+            key=lambda x: self._last_accessed(x[0], x[1] or {})
+        )
+        return [memory_id for memory_id, _ in entries[:count]]
+
+    def _expired(self, ids: List[str], metadatas: List[Dict[str, Any]], now: float) -> List[str]:
+        """Ids of memories older than the TTL configured for their type"""
+        expired = []
+        for memory_id, metadata in zip(ids, metadatas):
+            metadata = metadata or {}
+            ttl = self.ttls.get(metadata.get("type"))
+            if ttl is not None and now - self._created_at(metadata) >= ttl:
+                expired.append(memory_id)
+        return expired
+
+    def evict_lru(self) -> int:
+        """
+        Evict least recently accessed memories once max_entries is exceeded
+
+        Evicts in one batch down to EVICTION_WATERMARK of max_entries, so the
+        full scan is not repeated on every subsequent write.
+
+        Returns:
+            Number of memories evicted
+        """
+        try:
+            with self._lock:
+                excess = self._eviction_count(self.collection.count())
+                if excess <= 0:
+                    return 0
+
+                all_results = self.collection.get(include=["metadatas"])
+                evicted = self._least_recently_used(
+                    all_results["ids"], all_results["metadatas"], excess
+                )
+
+                if evicted:
+                    self.collection.delete(ids=evicted)
+                for memory_id in evicted:
+                    self._pending_access.pop(memory_id, None)
+                self.retention_stats["evicted"] += len(evicted)
+                return len(evicted)
+
+        except Exception as e:
+            print(f"Error evicting memories: {e}")
+            return 0
+
+    def _duplicate_results(
+        self,
+        ids: List[str],
+        metadatas: List[Dict[str, Any]],
+        embeddings: List[List[float]],
+        skip: set,
+        inherited: Dict[str, float],
+    ) -> set:
+        """
+        Find near-duplicate result memories
+
+        Results are visited from most to least recently accessed, and a
+        neighbour is only removed if it was accessed less recently than the
+        entry being visited, so the most recently accessed copy survives. The
+        survivor inherits the latest access time of the copies it replaces,
+        which is recorded in `inherited`.
+
+        Returns:
+            Ids of the memories to remove
+        """
+        results = [
+            i for i, metadata in enumerate(metadatas)
+            if (metadata or {}).get("type") == "result" and ids[i] not in skip
+        ]
+        if len(results) < 2:
+            return set()
+
+        results.sort(key=lambda i: self._last_accessed(ids[i], metadatas[i] or {}), reverse=True)
+        rank = {ids[i]: position for position, i in enumerate(results)}
+        total_results = self.collection.count()
+
+        removed = set()
+        for i in results:
+            memory_id = ids[i]
+            if memory_id in removed:
+                continue
+            neighbours = self.collection.query(
+                query_embeddings=[embeddings[i]],
+                n_results=min(DUPLICATE_NEIGHBOURS, total_results),
+                where={"type": "result"},
+                include=["distances", "metadatas"]
+            )
+            for neighbour_id, distance, neighbour_meta in zip(
+                neighbours["ids"][0], neighbours["distances"][0], neighbours["metadatas"][0]
+            ):
+                if (
+                    neighbour_id in rank
+                    and neighbour_id not in removed
+                    and rank[neighbour_id] > rank[memory_id]
+                    and distance <= self.duplicate_distance
+                ):
+                    removed.add(neighbour_id)
+                    inherited[memory_id] = max(
+                        inherited.get(memory_id, 0.0),
+                        self._last_accessed(neighbour_id, neighbour_meta or {})
+                    )
+
+        return removed
+
+    def _flush_access(self, access: Dict[str, float]) -> None:
+        """Write access times kept in memory out to the stored metadata"""
+        ids = sorted(access)
+        for start in range(0, len(ids), UPDATE_BATCH_SIZE):
+            current = self.collection.get(ids=ids[start:start + UPDATE_BATCH_SIZE], include=["metadatas"])
+            metadatas = []
+            for memory_id, metadata in zip(current["ids"], current["metadatas"]):
+                metadata = dict(metadata or {})
+                metadata["last_accessed"] = max(self._last_accessed(memory_id, metadata), access[memory_id])
+                metadatas.append(metadata)
+            if current["ids"]:
+                self.collection.update(ids=current["ids"], metadatas=metadatas)
+
+    def _prune_store(self) -> int:
+        """
+        Delete rows ChromaDB leaves behind in its SQLite store
+
+        chromadb 0.4.x never removes consumed embeddings_queue rows, keeps
+        full-text rows of deleted entries, and leaves the metadata segment's
+        rows in place when a collection is dropped. Queue rows are only pruned
+        once both the metadata segment and the persisted vector index have
+        consumed them, so nothing needs to be replayed from them on restart.
+
+        Returns:
+            Number of rows deleted
+        """
+        db_path = os.path.join(self.persist_directory, "chroma.sqlite3")
+        if not os.path.exists(db_path):
+            return 0
+
+        conn = sqlite3.connect(db_path, timeout=30)
+        try:
+            with conn:
+                deleted = 0
+                for statement in (
+                    "DELETE FROM embeddings WHERE segment_id NOT IN (SELECT id FROM segments)",
+                    "DELETE FROM embedding_metadata WHERE id NOT IN (SELECT id FROM embeddings)",
+                    "DELETE FROM embedding_fulltext_search WHERE rowid NOT IN (SELECT id FROM embeddings)",
+                    "DELETE FROM max_seq_id WHERE segment_id NOT IN (SELECT id FROM segments)",
+                    # Keep the newest row so SQLite never hands out a seq_id twice
+                    "DELETE FROM embeddings_queue WHERE topic NOT IN (SELECT topic FROM collections)"
+                    " AND seq_id < (SELECT MAX(seq_id) FROM embeddings_queue)",
+                ):
+                    deleted += conn.execute(statement).rowcount
+
+                for topic, segment_ids in self._segments_by_topic(conn).items():
+                    consumed = self._consumed_seq_ids(conn, segment_ids)
+                    if consumed is None:
+                        continue
+                    metadata_seq_id, vector_seq_id = consumed
+                    # Metadata-only updates are a no-op for the vector index on replay
+                    deleted += conn.execute(
+                        "DELETE FROM embeddings_queue WHERE topic = ? AND seq_id < ?"
+                        " AND (seq_id <= ? OR (operation = 1 AND vector IS NULL))",
+                        (topic, metadata_seq_id, vector_seq_id)
+                    ).rowcount
+
+            live = {row[0] for row in conn.execute("SELECT id FROM segments")}
+        finally:
+            conn.close()
+
+        # Vector index folders of segments that no longer exist
+        for name in os.listdir(self.persist_directory):
+            path = os.path.join(self.persist_directory, name)
+            if (
+                name not in live
+                and os.path.isdir(path)
+                and os.path.exists(os.path.join(path, "index_metadata.pickle"))
+            ):
+                shutil.rmtree(path, ignore_errors=True)
+
+        return deleted
+
+    @staticmethod
+    def _segments_by_topic(conn: sqlite3.Connection) -> Dict[str, List[str]]:
+        """Segment ids of every collection, keyed by the collection's queue topic"""
+        segments: Dict[str, List[str]] = {}
+        for topic, segment_id in conn.execute(
+            "SELECT c.topic, s.id FROM collections c JOIN segments s ON s.collection = c.id"
+        ):
+            segments.setdefault(topic, []).append(segment_id)
+        return segments
+
+    def _consumed_seq_ids(self, conn: sqlite3.Connection, segment_ids: List[str]):
+        """
+        Last queue positions consumed by a collection's segments
+
+        Returns:
+            Tuple of (metadata segment seq_id, persisted vector index seq_id),
+            or None if either segment has not consumed anything yet
+        """
+        metadata_seq_id = None
+        vector_seq_id = None
+        for segment_id in segment_ids:
+            row = conn.execute(
+                "SELECT seq_id FROM max_seq_id WHERE segment_id = ?", (segment_id,)
+            ).fetchone()
+            if row is not None:
+                metadata_seq_id = int.from_bytes(row[0], "big")
+
+            pickle_path = os.path.join(self.persist_directory, segment_id, "index_metadata.pickle")
+            if os.path.exists(pickle_path):
+                vector_seq_id = PersistentData.load_from_file(pickle_path).max_seq_id
+
+        if metadata_seq_id is None or vector_seq_id is None:
+            return None
+        return metadata_seq_id, vector_seq_id
+
+    def vacuum(self, force: bool = False) -> bool:
+        """
+        Reclaim free pages in the underlying SQLite store
+
+        SQLite reuses free pages for later writes, so the file is only rewritten
+        once at least VACUUM_FREE_FRACTION of it is free, unless forced.
+
+        Returns:
+            Whether VACUUM ran
+        """
+        db_path = os.path.join(self.persist_directory, "chroma.sqlite3")
+        if not os.path.exists(db_path):
+            return False
+        try:
+            conn = sqlite3.connect(db_path, timeout=30)
+            try:
+                free = conn.execute("PRAGMA freelist_count").fetchone()[0]
+                total = conn.execute("PRAGMA page_count").fetchone()[0]
+                if not force and (not total or free / total < VACUUM_FREE_FRACTION):
+                    return False
+                conn.execute("VACUUM")
+                return True
+            finally:
+                conn.close()
+        except Exception as e:
+            print(f"Error vacuuming memory store: {e}")
+            return False
+
+    def compact(self) -> Dict[str, Any]:
+        """
+        Apply TTLs, merge near-duplicate results, evict LRU entries and reclaim disk space
+
+        Entries are scanned and the plan is made without holding the lock; it is
+        only taken to delete, write out access times and prune the store.
+        Entries written or read after the scan started are left alone.
+
+        Returns:
+            Dictionary with the outcome of this compaction run. bytes_reclaimed
+            is the signed change in store size, negative if the store grew.
+        """
+        size_before = self._store_size()
+        started = time.time()
+        with self._lock:
+            collection = self.collection
+        entries = collection.get(include=["metadatas", "embeddings"])
+        ids = entries["ids"]
+        metadatas = [dict(metadata or {}) for metadata in entries["metadatas"]]
+
+        expired = set(self._expired(ids, metadatas, started))
+        inherited: Dict[str, float] = {}
+        merged = self._duplicate_results(ids, metadatas, entries["embeddings"], expired, inherited)
+
+        alive = [i for i, memory_id in enumerate(ids) if memory_id not in expired | merged]
+        evicted = set(self._least_recently_used(
+            [ids[i] for i in alive],
+            [metadatas[i] for i in alive],
+            self._eviction_count(len(alive))
+        ))
+
+        with self._lock:
+            # Keep anything that was written or read while we were planning
+            removed = expired | merged | evicted
+            if removed:
+                current = self.collection.get(ids=sorted(removed), include=["metadatas"])
+                for memory_id, metadata in zip(current["ids"], current["metadatas"]):
+                    if self._last_accessed(memory_id, metadata or {}) > started:
+                        expired.discard(memory_id)
+                        merged.discard(memory_id)
+                        evicted.discard(memory_id)
+                removed = expired | merged | evicted
+
+            if removed:
+                self.collection.delete(ids=sorted(removed))
+
+            access = {
+                memory_id: accessed for memory_id, accessed in self._pending_access.items()
+                if memory_id not in removed
+            }
+            for memory_id, accessed in inherited.items():
+                access[memory_id] = max(access.get(memory_id, 0.0), accessed)
+            self._flush_access(access)
+            self._pending_access.clear()
+
+            pruned = self._prune_store()
+            if removed or pruned:
+                self.vacuum()
+            reclaimed = size_before - self._store_size()
+
+            self.retention_stats["expired_deleted"] += len(expired)
+            self.retention_stats["merged"] += len(merged)
+            self.retention_stats["evicted"] += len(evicted)
+            self.retention_stats["rows_pruned"] += pruned
+            self.retention_stats["compactions"] += 1
+            self.retention_stats["bytes_reclaimed"] += reclaimed
+            self.retention_stats["last_compaction"] = datetime.now().isoformat()
+
+            return {
+                "expired": len(expired),
+                "merged": len(merged),
+                "evicted": len(evicted),
+                "pruned_rows": pruned,
+                "bytes_reclaimed": reclaimed
+            }
+
+    def start_compaction(self, interval: float = 3600) -> None:
+        """
+        Run compaction periodically in a background thread
+
+        Args:
+            interval: Seconds between compaction runs
+        """
+        if self._compaction_thread and self._compaction_thread.is_alive():
+            return
+
+        self._stop_compaction.clear()
+
+        def _run():
+            while not self._stop_compaction.wait(interval):
+                try:
+                    self.compact()
+                except Exception as e:
+                    print(f"Error compacting memory: {e}")
+
+        self._compaction_thread = threading.Thread(
+            target=_run, name="memory-compaction", daemon=True
+        )
+        self._compaction_thread.start()
+
+    def stop_compaction(self) -> None:
+        """Stop the background compaction thread"""
+        self._stop_compaction.set()
+        if self._compaction_thread:
+            self._compaction_thread.join()
+            self._compaction_thread = None
@@ -0,0 +1,237 @@
+import os
+import sqlite3
+import string
+import time
+
+import pytest
+
+from memory import COLLECTION_NAME, REBUILD_COLLECTION_NAME, LocalMemory
+
+# Enough entries for ChromaDB to persist its vector index (every 1000 adds),
+# which is what allows consumed queue rows to be pruned
+PERSISTED_ENTRIES = 1100
+
+
+class LetterEmbedding:
+    """Cheap deterministic embedding: normalized letter frequencies"""
+
+    def __call__(self, input):
+        embeddings = []
+        for text in input:
+            counts = [float(text.lower().count(c)) for c in string.ascii_lowercase]
+            norm = sum(c * c for c in counts) ** 0.5 or 1.0
+            embeddings.append([c / norm for c in counts])
+        return embeddings
+
+
+@pytest.fixture
+def make_memory(tmp_path):
+    memories = []
+
+    def _make(**kwargs):
+        memory = LocalMemory(
+            persist_directory=str(tmp_path / "chroma_db"),
+            embedding_function=LetterEmbedding(),
+            **kwargs
+        )
+        memories.append(memory)
+        return memory
+
+    yield _make
+    for memory in memories:
+        memory.stop_compaction()
+
+
+def _sqlite_size(memory):
+    return os.path.getsize(os.path.join(memory.persist_directory, "chroma.sqlite3"))
+
+
+def _row_count(memory, table):
+    conn = sqlite3.connect(os.path.join(memory.persist_directory, "chroma.sqlite3"))
+    try:
+        return conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+    finally:
+        conn.close()
+
+
+def test_persist_directory_is_absolute(make_memory, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    memory = make_memory()
+    assert memory.persist_directory == str(tmp_path / "chroma_db")
+
+
+def test_duplicate_write_is_skipped(make_memory):
+    memory = make_memory()
+    first = memory.add_memory("Task: build it", {"type": "task", "workspace": "a"})
+    before = memory.collection.get(ids=[first], include=["metadatas"])["metadatas"][0]
+    second = memory.add_memory("Task: build it", {"type": "task", "workspace": "b"})
+
+    assert first == second
+    assert memory.collection.count() == 1
+    assert memory.retention_stats["duplicates_skipped"] == 1
+    stored = memory.collection.get(ids=[first], include=["metadatas"])["metadatas"][0]
+    assert stored["workspace"] == "b"
+    assert stored["timestamp"] > before["timestamp"]
+    assert stored["created_at"] > before["created_at"]
+
+
+def test_same_content_with_different_type_is_kept(make_memory):
+    memory = make_memory()
+    task_id = memory.add_memory("same text", {"type": "task"})
+    result_id = memory.add_memory("same text", {"type": "result"})
+
+    assert task_id != result_id
+    assert memory.collection.count() == 2
+
+
+def test_ttl_expiry_per_type(make_memory):
+    memory = make_memory(ttls={"task": 0, "result": 3600})
+    memory.add_memory("Task: old", {"type": "task"})
+    result_id = memory.add_memory("Result: kept", {"type": "result"})
+
+    outcome = memory.compact()
+
+    assert outcome["expired"] == 1
+    assert memory.collection.get()["ids"] == [result_id]
+    assert memory.retention_stats["expired_deleted"] == 1
+
+
+def test_eviction_order_follows_last_access(make_memory):
+    memory = make_memory(max_entries=3)
+    ids = [memory.add_memory(text, {"type": "task"}) for text in ("alpha", "bravo", "charlie")]
+
+    # Reading the oldest entry makes "bravo" the least recently used
+    memory.search_memory("alpha", n_results=1)
+    memory.add_memory("delta", {"type": "task"})
+
+    remaining = set(memory.collection.get()["ids"])
+    assert ids[1] not in remaining
+    assert ids[0] in remaining
+    assert memory.retention_stats["evicted"] == 2
+
+
+def test_eviction_batches_down_to_watermark(make_memory):
+    memory = make_memory(max_entries=10)
+    for i in range(11):
+        memory.add_memory(f"entry {i}", {"type": "task"})
+
+    assert memory.collection.count() == 9
+
+
+def test_merge_keeps_most_recently_accessed(make_memory):
+    memory = make_memory(duplicate_distance=0.01)
+    old_id = memory.add_memory("Result: wrote hello world", {"type": "result"})
+    new_id = memory.add_memory("Result: wrote hello world!", {"type": "result"})
+    other_id = memory.add_memory("Result: zzz", {"type": "result"})
+
+    outcome = memory.compact()
+
+    remaining = set(memory.collection.get()["ids"])
+    assert outcome["merged"] == 1
+    assert remaining == {new_id, other_id}
+    assert old_id not in remaining
+
+
+def test_compaction_persists_access_times(make_memory):
+    memory = make_memory()
+    memory_id = memory.add_memory("Task: read me", {"type": "task"})
+    before = memory.collection.get(ids=[memory_id], include=["metadatas"])["metadatas"][0]
+
+    memory.search_memory("read me", n_results=1)
+    memory.compact()
+
+    after = memory.collection.get(ids=[memory_id], include=["metadatas"])["metadatas"][0]
+    assert after["last_accessed"] > before["last_accessed"]
+    assert after["created_at"] == before["created_at"]
+    assert memory.retention_stats["compactions"] == 1
+
+
+def test_start_and_stop_compaction(make_memory):
+    memory = make_memory(ttls={"task": 0})
+    memory.add_memory("Task: short lived", {"type": "task"})
+
+    memory.start_compaction(interval=0.01)
+    thread = memory._compaction_thread
+    assert thread.is_alive()
+
+    # Starting again keeps the running thread
+    memory.start_compaction(interval=0.01)
+    assert memory._compaction_thread is thread
+
+    deadline = time.time() + 10
+    while memory.retention_stats["compactions"] == 0 and time.time() < deadline:
+        thread.join(0.01)
+    memory.stop_compaction()
+
+    assert not thread.is_alive()
+    assert memory._compaction_thread is None
+    assert memory.collection.count() == 0
+
+
+def test_repeated_compaction_does_not_grow_store(make_memory):
+    memory = make_memory(max_entries=PERSISTED_ENTRIES * 2)
+    for i in range(PERSISTED_ENTRIES):
+        memory.add_memory(f"Task: entry {i}", {"type": "task"})
+
+    sizes = []
+    for round in range(4):
+        for i in range(20):
+            memory.search_memory(f"entry {round * 20 + i}", n_results=3)
+        memory.compact()
+        sizes.append(_sqlite_size(memory))
+
+    assert memory.collection.count() == PERSISTED_ENTRIES
+    assert _row_count(memory, "embeddings") == PERSISTED_ENTRIES
+    assert max(sizes) <= sizes[0]
+
+
+def test_expiry_shrinks_store(make_memory):
+    memory = make_memory(ttls={"task": 0})
+    for i in range(PERSISTED_ENTRIES):
+        memory.add_memory(f"Task: entry {i}", {"type": "task"})
+    sqlite_before = _sqlite_size(memory)
+    store_before = memory.get_memory_stats()["store_bytes"]
+
+    outcome = memory.compact()
+
+    assert outcome["expired"] == PERSISTED_ENTRIES
+    assert _sqlite_size(memory) < sqlite_before
+    assert outcome["bytes_reclaimed"] == store_before - memory.get_memory_stats()["store_bytes"]
+    assert outcome["bytes_reclaimed"] > 0
+    assert memory.retention_stats["bytes_reclaimed"] == outcome["bytes_reclaimed"]
+    for table in ("embeddings", "embedding_metadata", "embedding_fulltext_search"):
+        assert _row_count(memory, table) == 0
+
+
+def test_vacuum_only_runs_with_enough_free_pages(make_memory):
+    memory = make_memory()
+    memory.add_memory("Task: keep me", {"type": "task"})
+
+    assert not memory.vacuum()
+    assert memory.vacuum(force=True)
+
+
+def test_leftover_rebuild_collection_is_recovered(make_memory):
+    memory = make_memory()
+    leftover = memory._open_collection(REBUILD_COLLECTION_NAME)
+    leftover.add(ids=["memory_kept"], documents=["Result: kept"], metadatas=[{"type": "result"}])
+    memory.client.delete_collection(COLLECTION_NAME)
+
+    recovered = make_memory()
+
+    names = [c.name for c in recovered.client.list_collections()]
+    assert names == [COLLECTION_NAME]
+    assert recovered.collection.get()["ids"] == ["memory_kept"]
+
+
+def test_leftover_rebuild_collection_is_dropped_when_main_exists(make_memory):
+    memory = make_memory()
+    memory_id = memory.add_memory("Task: original", {"type": "task"})
+    leftover = memory._open_collection(REBUILD_COLLECTION_NAME)
+    leftover.add(ids=["memory_partial"], documents=["Task: partial"], metadatas=[{"type": "task"}])
+
+    recovered = make_memory()
+
+    names = [c.name for c in recovered.client.list_collections()]
+    assert names == [COLLECTION_NAME]
+    assert recovered.collection.get()["ids"] == [memory_id]